@@ -2,10 +2,16 @@ import asyncio
 import logging
 import typer
 
+try:
+    import uvloop  # optional C event loop; not available on Windows
+except ImportError:
+    uvloop = None
+
 from rag_agent.logging_setup import setup_logging
 from rag_agent.models import StopConfig
 from rag_agent.fetch import navigate_with_plan
-from rag_agent.storage import ORG_PATH, PROJ_PATH
+from rag_agent.llm import expand_descriptions_batch
+from rag_agent.storage import ORG_PATH, PROJ_PATH, data_lock, load_orgs, load_projects, save_orgs, save_projects
 
 setup_logging()
 logger = logging.getLogger("app.cli")
@@ -27,7 +33,51 @@ def run(url: str):
                    f"Actions={state.metrics.actions_total} NewRatio={state.metrics.frontier_new_ratio:.2f}")
         typer.echo(f"Saved to: orgs={ORG_PATH} projects={PROJ_PATH}")
 
-    asyncio.run(_run())
+    (uvloop.run if uvloop else asyncio.run)(_run())
+
+
+@app.command()
+def expand(min_chars: int = 600):
+    """
+    Expand every stored project description shorter than --min-chars via the OpenAI Batch API.
+    Example:
+      python app.py expand
+    """
+    with data_lock():
+        todo = {str(p["project_id"]): p["description"] for p in load_projects()
+                if 0 < len((p.get("description") or "").strip()) < min_chars}
+    if not todo:
+        typer.echo("Nothing to expand.")
+        return
+
+    # The batch can take hours: don't hold the lock (and block `run`/`compact`) while it runs
+    texts = expand_descriptions_batch([(pid, desc, None) for pid, desc in todo.items()], min_chars=min_chars)
+
+    changed = 0
+    with data_lock():
+        projs = load_projects()
+        for p in projs:
+            pid = str(p["project_id"])
+            text = texts.get(pid)
+            # Skip projects whose description changed (e.g. a crawl) while the batch ran
+            if pid in todo and p.get("description") == todo[pid] and text and text != todo[pid]:
+                projs.update(p, description=text)
+                changed += 1
+        projs.flush()
+    typer.echo(f"Expanded {changed}/{len(todo)} project descriptions -> {PROJ_PATH}")
+
+
+@app.command()
+def compact():
+    """
+    Fold data/*.jsonl change logs (left by an interrupted crawl) into the .json files.
+    Example:
+      python app.py compact
+    """
+    with data_lock():
+        save_orgs(load_orgs())
+        save_projects(load_projects())
+    typer.echo(f"Compacted: orgs={ORG_PATH} projects={PROJ_PATH}")
 
 
 if __name__ == "__main__":
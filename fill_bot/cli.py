@@ -1,11 +1,32 @@
 import typer
-import json
+import asyncio
+import orjson
 import glob
+import os
+from functools import lru_cache
+try:
+    import uvloop  # optional C event loop; not available on Windows
+except ImportError:
+    uvloop = None
 from ingest import build_index
 from search import run_topic_search
 
 app = typer.Typer()
 
+# Files processed at once; each file's work is network-bound (embeddings + extraction)
+FILL_CONCURRENCY = int(os.getenv("FILL_CONCURRENCY", "4"))
+
+@lru_cache(maxsize=None)
+def _load_topics(path: str, mtime: float):
+    # mtime is part of the cache key so an edited topics file is re-read
+    with open(path, "rb") as f:
+        topics = orjson.loads(f.read())
+    lookup = {}
+    for t in topics:
+        lookup.setdefault(t["id"].lower(), t)
+        lookup.setdefault(t["name"].lower(), t)
+    return lookup
+
 @app.command()
 def fill(topic_name: str, topics_file: str = "topics.json"):
     """
@@ -13,16 +34,9 @@ def fill(topic_name: str, topics_file: str = "topics.json"):
       python app.py fill disinformation
     Looks up 'disinformation' in topics.json and processes all PDFs/DOCXs in root.
     """
-    # Load topics.json from root
-    with open(topics_file, "r", encoding="utf-8") as f:
-        topics = json.load(f)
-
-    # Find the topic by id or name
-    topic = None
-    for t in topics:
-        if t["id"].lower() == topic_name.lower() or t["name"].lower() == topic_name.lower():
-            topic = t
-            break
+    # Load topics.json from root; find the topic by id or name
+    lookup = _load_topics(topics_file, os.path.getmtime(topics_file))
+    topic = lookup.get(topic_name.lower())
 
     if not topic:
         typer.echo(f"Topic '{topic_name}' not found in {topics_file}")
@@ -34,12 +48,19 @@ def fill(topic_name: str, topics_file: str = "topics.json"):
         typer.echo("No PDF/DOCX files found in the root directory.")
         return
 
-    for file_path in files:
-        typer.echo(f"Indexing file: {file_path}")
-        index_id = build_index(file_path)
+    async def process(file_path: str, sem: asyncio.Semaphore):
+        async with sem:
+            typer.echo(f"Indexing file: {file_path}")
+            index_id = await build_index(file_path)
+
+            typer.echo(f"  → Processing topic: {topic['name']} ({file_path})")
+            await run_topic_search(topic, index_id, file_path)
+
+    async def main():
+        sem = asyncio.Semaphore(FILL_CONCURRENCY)
+        await asyncio.gather(*(process(f, sem) for f in files))
 
-        typer.echo(f"  → Processing topic: {topic['name']}")
-        run_topic_search(topic, index_id, file_path)
+    (uvloop.run if uvloop else asyncio.run)(main())
 
 if __name__ == "__main__":
     app()
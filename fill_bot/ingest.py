@@ -1,45 +1,190 @@
 import fitz  # pymupdf
+import numpy as np
+import tiktoken
 from docx import Document
-from openai import OpenAI
-import hashlib, os, sqlite3, json
+from openai import AsyncOpenAI
+import asyncio, hashlib, os, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 
-client = OpenAI()
+client = AsyncOpenAI()
+
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_BATCH = 256  # inputs per embeddings request, well under the API's 2048 / 300K-token caps
+CHUNK_TOKENS = 500   # ~2000 chars of prose
+CHUNK_OVERLAP = 50   # tokens shared by consecutive chunks so sentences are not lost at the cut
+
+_enc = tiktoken.get_encoding("cl100k_base")  # tokenizer of text-embedding-3-*
+
+# PyMuPDF (and python-docx) are not safe to drive from several threads at once, so all
+# document extraction runs on this one worker; only the embedding requests overlap.
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extract")
 
 def file_id(path: str) -> str:
-    return hashlib.sha1(open(path, "rb").read()).hexdigest()[:12]
+    # Stream in 1 MiB blocks so large PDFs are never read into memory whole
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while buf := f.read(1 << 20):
+            h.update(buf)
+    return h.hexdigest()[:12]
 
-def build_index(file_path: str):
-    doc_id = file_id(file_path)
-    index_file = f"fill_agent/{doc_id}_index.json"
+EMB_CACHE_DIR = f"fill_agent/emb_cache/{EMBED_MODEL}"  # raw float32 vectors keyed by chunk-text SHA1
+QUANT_SCALE = 127  # unit-norm components in [-1, 1] -> int8
 
-    if os.path.exists(index_file):
-        return doc_id  # already indexed
+def index_paths(doc_id: str):
+    """(texts_file, vecs_file) for a document: chunk texts as JSON, unit-norm int8 embeddings as .npy."""
+    return f"fill_agent/{doc_id}_texts.json", f"fill_agent/{doc_id}_vecs_i8.npy"
+
+def normalized(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+def quantize(vectors) -> np.ndarray:
+    """L2-normalize rows and store them as int8 (x * 127): 4x smaller than float32."""
+    return np.clip(np.round(normalized(vectors) * QUANT_SCALE), -QUANT_SCALE, QUANT_SCALE).astype(np.int8)
+
+def save_index(doc_id: str, texts, vectors):
+    texts_file, vecs_file = index_paths(doc_id)
+    os.makedirs(os.path.dirname(texts_file), exist_ok=True)
+    m = np.asarray(vectors, dtype=np.float32)
+    # A document with no extractable text (empty DOCX, scanned PDF) gets an explicit (0, 0) index
+    m = m.reshape(len(texts), -1) if len(texts) else np.empty((0, 0), dtype=np.float32)
+    # build_index treats an existing vecs file as "indexed": write the texts first, and each
+    # file under a temp name + os.replace, so an interrupt never leaves a half index behind
+    tmp = texts_file + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(texts))
+    os.replace(tmp, texts_file)
+    tmp = vecs_file + ".tmp.npy"
+    np.save(tmp, quantize(m))
+    os.replace(tmp, vecs_file)
+
+def load_index(doc_id: str):
+    """Return (texts, vecs) where vecs is a read-only int8 memory map of shape (C, D), rows scaled to QUANT_SCALE."""
+    texts_file, vecs_file = index_paths(doc_id)
+    with open(texts_file, "rb") as f:
+        texts = orjson.loads(f.read())
+    return texts, np.load(vecs_file, mmap_mode="r")
+
+def _migrate_legacy_index(doc_id: str) -> bool:
+    """Convert older on-disk formats without re-embedding: float32 {doc_id}_vecs.npy or {doc_id}_index.json."""
+    texts_file, _ = index_paths(doc_id)
+    float_vecs = f"fill_agent/{doc_id}_vecs.npy"
+    if os.path.exists(float_vecs) and os.path.exists(texts_file):
+        with open(texts_file, "rb") as f:
+            texts = orjson.loads(f.read())
+        save_index(doc_id, texts, np.load(float_vecs))
+        return True
+    legacy = f"fill_agent/{doc_id}_index.json"
+    if not os.path.exists(legacy):
+        return False
+    with open(legacy, "rb") as f:
+        items = orjson.loads(f.read())
+    save_index(doc_id, [it["text"] for it in items], [it["embedding"] for it in items])
+    return True
+
+def _batched(items, size):
+    batch = []
+    for it in items:
+        batch.append(it)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    # Extract text
+def text_sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _emb_cache_path(sha: str) -> str:
+    return os.path.join(EMB_CACHE_DIR, sha[:2], f"{sha}.npy")
+
+def _emb_cache_get_many(shas):
+    """Cached vectors for `shas` (None for a miss), in order."""
+    out = []
+    for sha in shas:
+        path = _emb_cache_path(sha)
+        out.append(np.load(path) if os.path.exists(path) else None)
+    return out
+
+def _emb_cache_put_many(items) -> None:
+    for sha, vector in items:
+        path = _emb_cache_path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npy"
+        np.save(tmp, np.asarray(vector, dtype=np.float32))
+        os.replace(tmp, path)
+
+async def _embed_batch(batch):
+    """Embed one batch; texts embedded before (by any document) come from EMB_CACHE_DIR."""
+    shas = [text_sha1(t) for t in batch]
+    # One file per chunk: do the cache reads/writes in a thread, not on the event loop
+    vectors = await asyncio.to_thread(_emb_cache_get_many, shas)
+    misses = [i for i, v in enumerate(vectors) if v is None]
+    if misses:
+        resp = await client.embeddings.create(input=[batch[i] for i in misses], model=EMBED_MODEL)
+        for i, d in zip(misses, sorted(resp.data, key=lambda d: d.index)):
+            vectors[i] = d.embedding
+        await asyncio.to_thread(_emb_cache_put_many, [(shas[i], vectors[i]) for i in misses])
+    return vectors
+
+async def embed_texts(texts):
+    """Embed a list of strings with as few API calls as possible (issued concurrently), preserving order."""
+    results = await asyncio.gather(*(_embed_batch(b) for b in _batched(texts, EMBED_BATCH)))
+    return [v for batch in results for v in batch]
+
+def iter_text_parts(file_path: str):
+    """Yield a document's text piece by piece (PDF pages / DOCX paragraphs)."""
     if file_path.endswith(".pdf"):
-        text = []
         with fitz.open(file_path) as pdf:
             for page in pdf:
-                text.append(page.get_text())
-        text = "\n".join(text)
+                yield page.get_text()
     elif file_path.endswith(".docx"):
         doc = Document(file_path)
-        text = "\n".join([p.text for p in doc.paragraphs])
+        for p in doc.paragraphs:
+            yield p.text
     else:
         raise ValueError("Unsupported file type")
 
-    # Chunk (naive split)
-    chunks = [text[i:i+1500] for i in range(0, len(text), 1500)]
+def iter_chunks(parts, size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP):
+    """
+    Token windows of `size` tokens (consecutive windows share `overlap` tokens) over
+    "\n".join(parts), encoded part by part so the joined text is never materialized.
+    """
+    stride = size - overlap
+    buf, emitted = [], False
+    for i, part in enumerate(parts):
+        buf.extend(_enc.encode(("\n" if i else "") + part, disallowed_special=()))
+        while len(buf) >= size:
+            yield _enc.decode(buf[:size])
+            buf, emitted = buf[stride:], True
+    # Flush the tail unless it is only the overlap of the last emitted window
+    if len(buf) > (overlap if emitted else 0):
+        yield _enc.decode(buf)
+
+async def build_index(file_path: str):
+    doc_id = await asyncio.to_thread(file_id, file_path)
+    _, vecs_file = index_paths(doc_id)
+
+    if os.path.exists(vecs_file) or _migrate_legacy_index(doc_id):
+        return doc_id  # already indexed
 
-    # Embed
-    embeddings = []
-    for c in chunks:
-        emb = client.embeddings.create(input=c, model="text-embedding-3-small").data[0].embedding
-        embeddings.append({"text": c, "embedding": emb})
+    # Stream text -> token chunks -> batched embeddings, one batch in flight at a time.
+    # Extraction/tokenizing is CPU-bound and not thread-safe, so it runs on _EXTRACT_POOL.
+    loop = asyncio.get_running_loop()
+    batches = _batched(iter_chunks(iter_text_parts(file_path)), EMBED_BATCH)
+    chunks, vectors = [], []
+    try:
+        while (batch := await loop.run_in_executor(_EXTRACT_POOL, next, batches, None)) is not None:
+            chunks.extend(batch)
+            vectors.extend(await _embed_batch(batch))
+    finally:
+        # Close the generator (and the open PDF) on the extraction thread too
+        await loop.run_in_executor(_EXTRACT_POOL, batches.close)
 
-    # Save simple index as JSON
-    os.makedirs(os.path.dirname(index_file), exist_ok=True)
-    with open(index_file, "w", encoding="utf-8") as f:
-        json.dump(embeddings, f)
+    # Save index: texts as JSON, vectors as .npy so search can mmap them
+    save_index(doc_id, chunks, vectors)
 
     return doc_id
@@ -0,0 +1,40 @@
+import hashlib, os
+import orjson
+
+CACHE_DIR = "fill_agent/llm_cache"
+
+def cache_key(payload: dict) -> str:
+    """Content hash of everything that determines an LLM response (model, messages, params)."""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def get(key: str):
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+def put(key: str, value) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = _path(key) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(value))
+    os.replace(tmp, _path(key))
+
+async def acached_call(fn, payload_key: dict):
+    """
+    Return `await fn()`'s JSON-serializable result, reusing a previous result for an identical
+    payload_key. fn is a zero-argument coroutine function. Set LLM_CACHE=0 to bypass.
+    """
+    if os.getenv("LLM_CACHE") == "0":
+        return await fn()
+    key = cache_key(payload_key)
+    hit = get(key)
+    if hit is not None:
+        return hit
+    result = await fn()
+    put(key, result)
+    return result
@@ -1,39 +1,44 @@
-from openai import OpenAI
-import json, os
+from openai import AsyncOpenAI
+from llm_cache import acached_call
+import os
+import orjson
 
-client = OpenAI()
+client = AsyncOpenAI()
 
-def extract_with_llm(snippets, topic, file_path):
-    prompt = f"""
-    Topic: {topic['name']}
-    Description: {topic['description']}
-    Solutions: {topic['solutions']}
+def _system_prompt(topic) -> str:
+    # Static instructions first, topic context last: byte-identical for every file of a
+    # topic, so the provider's prompt-prefix cache can reuse it across calls.
+    return f"""You are an information extractor.
+From the text snippets provided by the user, extract any organizations or projects related
+to the topic below. Return a valid JSON object with two arrays:
+- "organizations": items with organization_id, name, description, website, contact_email
+- "projects": items with project_id, name, description, organization_id
+If nothing is found, return empty arrays.
 
-    From the text snippets below, extract any organizations or projects related
-    to this topic. Return valid JSON with fields:
-    - organization_id, name, description, website, contact_email
-    - project_id, name, description, organization_id
-    If nothing is found, return an empty array.
-    Snippets:
-    {snippets}
-    """
+Topic: {topic['name']}
+Description: {topic['description']}
+Solutions: {topic['solutions']}
+"""
 
-    response = client.chat.completions.create(
+async def extract_with_llm(snippets, topic, file_path):
+    request = dict(
         model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are an information extractor."},
-                  {"role": "user", "content": prompt}],
-        response_format={ "type": "json" }
+        temperature=0,
+        messages=[{"role": "system", "content": _system_prompt(topic)},
+                  {"role": "user", "content": f"Snippets:\n{snippets}"}],
+        response_format={ "type": "json_object" }
     )
 
-    data = response.choices[0].message.content
+    # Identical (model, prompt, params) -> reuse the stored response instead of a new call
+    async def _call():
+        resp = await client.chat.completions.create(**request)
+        return resp.choices[0].message.content
 
-    # Append results to storage
-    out_file = "fill_agent/extracted.json"
-    if os.path.exists(out_file):
-        existing = json.load(open(out_file, encoding="utf-8"))
-    else:
-        existing = []
+    data = await acached_call(_call, request)
 
-    existing.append({"topic": topic["id"], "file": file_path, "data": json.loads(data)})
-    with open(out_file, "w", encoding="utf-8") as f:
-        json.dump(existing, f, ensure_ascii=False, indent=2)
+    # Append results to storage (JSON Lines: one record per call, O(1) append)
+    out_file = "fill_agent/extracted.jsonl"
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    rec = {"topic": topic["id"], "file": file_path, "data": orjson.loads(data)}
+    with open(out_file, "ab") as f:
+        f.write(orjson.dumps(rec) + b"\n")
@@ -1,26 +1,71 @@
-import json, numpy as np
-from openai import OpenAI
+import hashlib, os
+import numpy as np
+import orjson
+from ingest import QUANT_SCALE, embed_texts, load_index, normalized, text_sha1
 from llm_extract import extract_with_llm
 
-client = OpenAI()
+TOP_K = 5
+SCORE_BLOCK = 8192  # int8 rows dequantized per matmul, bounds the float32 working set
+SNIPPETS_CACHE_DIR = "fill_agent/snippets_cache"
 
-def cosine(a, b):
-    a, b = np.array(a), np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def cosine_scores(Q: np.ndarray, vecs_i8: np.ndarray) -> np.ndarray:
+    """(T, C) cosine matrix of unit-norm float queries against the int8 index, block by block."""
+    out = np.empty((Q.shape[0], vecs_i8.shape[0]), dtype=np.float32)
+    for i in range(0, vecs_i8.shape[0], SCORE_BLOCK):
+        block = np.asarray(vecs_i8[i:i+SCORE_BLOCK], dtype=np.float32)
+        out[:, i:i+SCORE_BLOCK] = Q @ block.T
+    return out / QUANT_SCALE
 
-def run_topic_search(topic: dict, index_id: str, file_path: str):
-    index_file = f"fill_agent/{index_id}_index.json"
-    embeddings = json.load(open(index_file, encoding="utf-8"))
+def top_k_indices(scores: np.ndarray, k: int = TOP_K) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    k = min(k, scores.shape[0])
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(scores, -k)[-k:]
+    return idx[np.argsort(scores[idx])[::-1]]
 
-    results = []
-    for term in topic["terms"]:
-        query_emb = client.embeddings.create(input=term, model="text-embedding-3-small").data[0].embedding
-        for chunk in embeddings:
-            score = cosine(query_emb, chunk["embedding"])
-            results.append((score, chunk["text"]))
+def _snippets_key(topic: dict, texts) -> str:
+    # Same topic terms over the same set of chunks -> same top-k retrieval
+    blob = orjson.dumps({
+        "topic": topic["id"],
+        "terms": topic["terms"],
+        "k": TOP_K,
+        "chunks": sorted(text_sha1(t) for t in texts),
+    })
+    return hashlib.sha256(blob).hexdigest()
 
-    # sort and dedupe
-    results = sorted(results, key=lambda x: x[0], reverse=True)[:5]
-    snippets = [r[1] for r in results]
+def _retrieve_cached(key: str):
+    path = os.path.join(SNIPPETS_CACHE_DIR, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
-    extract_with_llm(snippets, topic, file_path)
+def _store_retrieved(key: str, snippets) -> None:
+    os.makedirs(SNIPPETS_CACHE_DIR, exist_ok=True)
+    path = os.path.join(SNIPPETS_CACHE_DIR, f"{key}.json")
+    with open(path + ".tmp", "wb") as f:
+        f.write(orjson.dumps(snippets))
+    os.replace(path + ".tmp", path)
+
+async def _retrieve(topic: dict, texts, vecs):
+    # (T, D) unit-norm queries against the (C, D) pre-normalized int8 chunk matrix
+    Q = normalized(await embed_texts(topic["terms"]))
+
+    # Full (T, C) cosine matrix via float32 BLAS; best term per chunk dedupes chunks
+    scores = cosine_scores(Q, vecs).max(axis=0)
+    return [texts[i] for i in top_k_indices(scores)]
+
+async def run_topic_search(topic: dict, index_id: str, file_path: str):
+    texts, vecs = load_index(index_id)
+    if not texts:
+        return  # nothing extractable in this document: no embedding or LLM calls
+
+    key = _snippets_key(topic, texts)
+    snippets = _retrieve_cached(key)
+    if snippets is None:
+        snippets = await _retrieve(topic, texts, vecs)
+        _store_retrieved(key, snippets)
+
+    # Extraction has its own response cache, so a rerun is token-free end to end
+    await extract_with_llm(snippets, topic, file_path)
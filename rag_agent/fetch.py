@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import os
 import time
 from typing import List, Dict, Tuple, Set
 from urllib.parse import urlparse
@@ -10,21 +11,27 @@ from urllib.parse import urlparse
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout, Page
 
 from rag_agent.models import Action, Plan, Metrics, StopConfig, WalkState, Snapshot, Anchor, ReflectOutput
-from rag_agent.parse import (
-    html_to_markdown,
-    extract_anchors,
-    extract_jsonld_objects,
-    bootstrap_site_hints,
-    same_site,
+from rag_agent.parse import parse_page_async, same_site
+from rag_agent.llm import CACHE_STATS, plan_site_walk, reflect_and_extract, expand_many
+from rag_agent.storage import (
+    upsert_org,
+    upsert_project,
+    load_orgs,
+    load_projects,
+    append_orgs,
+    append_projects,
+    data_lock,
 )
-from rag_agent.llm import plan_site_walk, reflect_and_extract
-from rag_agent.storage import upsert_org, upsert_project, load_orgs, load_projects, save_orgs, save_projects
 
 logger = logging.getLogger("rag_agent.fetch")
 
 CLICK_TIMEOUT = 5000
 NAV_TIMEOUT = 20000
-SCROLL_PAUSE_MS = 300
+IDLE_TIMEOUT = 6000  # extra settle time after DOM-ready; chatty pages never reach networkidle
+SCROLL_PAUSE_MS = 300  # max wait for new content after each scroll step
+CRAWL_CONCURRENCY = max(1, int(os.getenv("CRAWL_CONCURRENCY", "4")))  # pages fetched in parallel
+SAVE_EVERY = 50  # pages between compactions of the orgs/projects change logs (always compacted at the end)
+PROJECT_MIN_CHARS = 600  # new project descriptions shorter than this are expanded by the LLM
 
 
 def _allowed(url: str, plan: Plan) -> bool:
@@ -40,54 +47,56 @@ def _allowed(url: str, plan: Plan) -> bool:
 
 
 async def _grace_goto(page: Page, url: str) -> None:
+    # Navigate once to DOM-ready, then give the network a bounded chance to go idle.
+    # (Waiting for networkidle in goto and re-navigating on timeout loaded slow pages twice.)
+    await page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
     try:
-        await page.goto(url, wait_until="networkidle", timeout=NAV_TIMEOUT)
+        await page.wait_for_load_state("networkidle", timeout=IDLE_TIMEOUT)
     except PWTimeout:
-        # Try at least DOM-ready
-        await page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
+        pass
 
 
 async def _snapshot_page(page: Page, url: str) -> Snapshot:
-    # Stabilize content a bit
-    try:
-        await page.wait_for_load_state("networkidle", timeout=4000)
-    except Exception:
-        pass
-
     html = await page.content()
-    hints = bootstrap_site_hints(url, html)
-    md = html_to_markdown(html)
-    jsonld = extract_jsonld_objects(html, url)
-    anchors = extract_anchors(html, url, limit=200)
+    parsed = await parse_page_async(html, url)
 
     # Truncate HTML to keep snapshots light
     html_trunc = html if len(html) <= 120_000 else html[:120_000]
 
     return Snapshot(
         url=url,
-        title=hints.get("title"),
-        site_name=hints.get("site_name"),
-        meta_description=hints.get("meta_description"),
-        markdown=md,
+        title=parsed.title,
+        site_name=parsed.site_name,
+        meta_description=parsed.meta_description,
+        markdown=parsed.markdown,
         html_truncated=html_trunc,
-        jsonld_objects=jsonld,
-        anchors=[Anchor(text=a.get("text"), href=a["href"]) for a in anchors],
+        jsonld_objects=parsed.jsonld,
+        anchors=[Anchor(text=a.get("text"), href=a["href"]) for a in parsed.anchors],
     )
 
 
 async def _scroll_to_bottom(page: Page) -> None:
+    # Scroll until the page stops growing. After each scroll, wait only until scrollHeight
+    # changes (checked every animation frame), up to SCROLL_PAUSE_MS, instead of a fixed sleep.
     try:
         await page.evaluate(
-            """async () => {
-                let last = 0;
+            """async (maxWait) => {
+                const grew = (h) => new Promise(resolve => {
+                    const t0 = performance.now();
+                    const tick = () => {
+                        if (document.body.scrollHeight !== h) return resolve(true);
+                        if (performance.now() - t0 >= maxWait) return resolve(false);
+                        requestAnimationFrame(tick);
+                    };
+                    requestAnimationFrame(tick);
+                });
                 for (let i=0;i<10;i++){
-                    window.scrollTo(0, document.body.scrollHeight);
-                    await new Promise(r=>setTimeout(r, %d));
                     const h = document.body.scrollHeight;
-                    if (h === last) break;
-                    last = h;
+                    window.scrollTo(0, h);
+                    if (!(await grew(h))) break;
                 }
-            }""" % SCROLL_PAUSE_MS
+            }""",
+            SCROLL_PAUSE_MS,
         )
     except Exception:
         pass
@@ -96,6 +105,8 @@ async def _scroll_to_bottom(page: Page) -> None:
 async def navigate_with_plan(url: str, stop: StopConfig | None = None) -> Tuple[WalkState, List[Snapshot]]:
     """
     Crawl within budgets, reflect each page, collect org & project info.
+    Up to CRAWL_CONCURRENCY pages are fetched and reflected at once, one Playwright
+    page per worker sharing a single browser context.
     Returns (walk_state, all_snapshots).
     """
     plan = plan_site_walk(url)
@@ -103,99 +114,230 @@ async def navigate_with_plan(url: str, stop: StopConfig | None = None) -> Tuple[
         plan.stop = stop
 
     visited: Set[str] = set()
-    frontier: List[str] = [plan.start_url]
+    queued: Set[str] = {plan.start_url}     # everything ever put on the frontier
+    frontier: asyncio.Queue = asyncio.Queue()
+    frontier.put_nowait(plan.start_url)
+    leftover: List[str] = []                # frontier not visited when a stop triggered
     snapshots: List[Snapshot] = []
     metrics = Metrics()
+    cache_base = dict(CACHE_STATS)
 
-    orgs = load_orgs()
-    projs = load_projects()
     org_record = None  # last upserted org
+    store_lock = asyncio.Lock()
+    stopped = asyncio.Event()
 
     t0 = time.time()
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
 
+    def _hard_stop() -> bool:
+        if metrics.actions_total >= plan.stop.hard.max_actions:
+            logger.info("Stopping: reached max_actions=%d", plan.stop.hard.max_actions)
+            return True
+        if time.time() - t0 >= plan.stop.hard.time_budget_s:
+            logger.info("Stopping: reached time budget (s)=%d", plan.stop.hard.time_budget_s)
+            return True
+        return False
+
+    def _persist(reflect: ReflectOutput, snap: Snapshot) -> List[Dict]:
+        # Upsert org & projects as we go (org only first time or if better data).
+        # Runs in a thread, serialized by store_lock; touched records go to the change logs.
+        # Returns newly created projects whose description still needs expanding (done
+        # concurrently by the caller, not inline).
+        nonlocal org_record
+        created: List[Dict] = []
+        touched: List[Dict] = []
+        if reflect.organization:
+            org_record = upsert_org(orgs, reflect.organization)
+            append_orgs([org_record], orgs)
+
+        if org_record and reflect.projects:
+            for p in reflect.projects:
+                n_before = len(projs)
+                rec = upsert_project(
+                    projs,
+                    organization_id=org_record["organization_id"],
+                    name=p.name or "",
+                    description=p.description or "",
+                    source_url=p.source_url or snap.url,
+                    ensure_min_chars=0,
+                    site_markdown=snap.markdown or "",
+                )
+                touched.append(rec)
+                desc = rec.get("description") or ""
+                if len(projs) > n_before and desc and len(desc) < PROJECT_MIN_CHARS:
+                    created.append(rec)
+            append_projects(touched, projs)
+        return created
+
+    def _flush() -> None:
+        orgs.flush()
+        projs.flush()
+
+    def _final_flush() -> None:
+        # Each store on its own: one failing save must not cost the other its snapshot
+        for store in (orgs, projs):
+            try:
+                store.flush()
+            except Exception:
+                logger.exception("Final save failed; unsaved changes remain in the %s change log",
+                                 type(store).__name__)
+
+    async def _visit(page: Page, current: str) -> None:
+        logger.info("Visiting: %s", current)
+        await _grace_goto(page, current)
+        snap = await _snapshot_page(page, current)
+        snapshots.append(snap)
+        visited.add(current)
+        metrics.pages_visited += 1
+        page_no = metrics.pages_visited  # other workers bump the counter while this visit awaits
+
+        # reflect and extract (robust to schema hiccups)
         try:
-            while frontier:
-                # hard stops
-                if metrics.actions_total >= plan.stop.hard.max_actions:
-                    logger.info("Stopping: reached max_actions=%d", plan.stop.hard.max_actions)
-                    break
-                if time.time() - t0 >= plan.stop.hard.time_budget_s:
-                    logger.info("Stopping: reached time budget (s)=%d", plan.stop.hard.time_budget_s)
-                    break
-
-                current = frontier.pop(0)
-                if current in visited:
-                    continue
-                if not _allowed(current, plan):
-                    continue
-
-                logger.info("Visiting: %s", current)
-                await _grace_goto(page, current)
-                snap = await _snapshot_page(page, current)
-                snapshots.append(snap)
-                visited.add(current)
-                metrics.pages_visited += 1
-
-                # reflect and extract (robust to schema hiccups)
+            reflect = await reflect_and_extract(plan, [snap])
+        except Exception as e:
+            logger.warning("Reflect failed on %s: %s", current, e)
+            reflect = ReflectOutput(done=False, coverage="partial", justification="fallback after parse error")
+
+        actions = reflect.actions or []
+        goto_urls = [u for u in (reflect.goto_urls or []) if _allowed(u, plan)]
+
+        # Basic action execution (scroll only)
+        performed = 1  # count this step as an action
+        for a in actions:
+            if a.type == "SCROLL":
+                await _scroll_to_bottom(page)
+                performed += 1
+
+        async with store_lock:
+            created = await asyncio.to_thread(_persist, reflect, snap)
+
+        # Expand all short new project descriptions of this page in parallel
+        if created:
+            shorts = [rec["description"] for rec in created]
+            texts = await expand_many([(d, snap.markdown or "") for d in shorts], min_chars=PROJECT_MIN_CHARS)
+
+        async with store_lock:
+            if created:
+                # Another worker may have upserted a longer description meanwhile; keep that one
+                expanded: List[Dict] = []
+                for rec, short, text in zip(created, shorts, texts):
+                    if rec.get("description") == short and text != short:
+                        rec["description"] = text
+                        expanded.append(rec)
+                if expanded:
+                    projs.mark_dirty()
+                    await asyncio.to_thread(append_projects, expanded, projs)
+            if page_no % SAVE_EVERY == 0:
+                await asyncio.to_thread(_flush)
+
+        # Frontier management
+        new_links = 0
+        for u in goto_urls:
+            if u not in visited and u not in queued:
+                queued.add(u)
+                frontier.put_nowait(u)
+                new_links += 1
+
+        metrics.actions_total += performed
+        metrics.frontier_size = frontier.qsize()
+        metrics.push_window(performed, new_links, plan.stop.soft.plateau_window)
+
+        # soft stop (plateau)
+        if len(metrics.window_actions) >= plan.stop.soft.plateau_window:
+            if metrics.frontier_new_ratio < plan.stop.soft.min_new_ratio:
+                logger.info("Soft stop: frontier_new_ratio %.3f < %.3f",
+                            metrics.frontier_new_ratio, plan.stop.soft.min_new_ratio)
+                stopped.set()
+
+    live_workers = CRAWL_CONCURRENCY
+    retried: Set[str] = set()  # URLs already re-queued once after a failed visit
+
+    async def _open_page(context) -> Page | None:
+        """A fresh page for a worker, or None (the worker retires) if the browser won't give one."""
+        nonlocal live_workers
+        try:
+            return await context.new_page()
+        except Exception as e:
+            logger.warning("Worker could not open a page: %s", e)
+            live_workers -= 1
+            if live_workers == 0:
+                stopped.set()  # nobody left to drain the frontier; frontier.join() would never finish
+            return None
+
+    async def _worker(context) -> None:
+        page = await _open_page(context)
+        if page is None:
+            return
+        try:
+            while True:
+                current = await frontier.get()
                 try:
-                    reflect = reflect_and_extract(plan, [snap])
+                    if current is None:  # shutdown sentinel
+                        return
+                    if stopped.is_set():
+                        leftover.append(current)
+                        continue
+                    if current in visited or not _allowed(current, plan):
+                        continue
+                    if _hard_stop():
+                        stopped.set()
+                        leftover.append(current)
+                        continue
+                    await _visit(page, current)
                 except Exception as e:
-                    logger.warning("Reflect failed on %s: %s", current, e)
-                    reflect = ReflectOutput(done=False, coverage="partial", justification="fallback after parse error")
-
-                actions = reflect.actions or []
-                goto_urls = [u for u in (reflect.goto_urls or []) if _allowed(u, plan)]
-
-                # Basic action execution (scroll only)
-                performed = 1  # count this step as an action
-                for a in actions:
-                    if a.type == "SCROLL":
-                        await _scroll_to_bottom(page)
-                        performed += 1
-
-                # Upsert org & projects as we go (org only first time or if better data)
-                if reflect.organization:
-                    org_record = upsert_org(orgs, reflect.organization)
-                    save_orgs(orgs)
-
-                if org_record:
-                    for p in reflect.projects or []:
-                        upsert_project(
-                            projs,
-                            organization_id=org_record["organization_id"],
-                            name=p.name or "",
-                            description=p.description or "",
-                            source_url=p.source_url or snap.url,
-                            ensure_min_chars=600,
-                            site_markdown=snap.markdown or "",
-                        )
-                    save_projects(projs)
-
-                # Frontier management
-                new_links = 0
-                for u in goto_urls:
-                    if u not in visited and u not in frontier:
-                        frontier.append(u)
-                        new_links += 1
-
-                metrics.actions_total += performed
-                metrics.frontier_size = len(frontier)
-                metrics.push_window(performed, new_links, plan.stop.soft.plateau_window)
-
-                # soft stop (plateau)
-                if len(metrics.window_actions) >= plan.stop.soft.plateau_window:
-                    if metrics.frontier_new_ratio < plan.stop.soft.min_new_ratio:
-                        logger.info("Soft stop: frontier_new_ratio %.3f < %.3f",
-                                    metrics.frontier_new_ratio, plan.stop.soft.min_new_ratio)
-                        break
-
+                    logger.warning("Visit failed on %s: %s", current, e)
+                    if current not in visited and current not in retried:
+                        retried.add(current)
+                        frontier.put_nowait(current)  # one more try, on a fresh page
+                    # The page may be dead (renderer crash, "Target closed"): never reuse it
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+                    page = await _open_page(context)
+                    if page is None:
+                        return
+                finally:
+                    frontier.task_done()
         finally:
-            await context.close()
-            await browser.close()
-
-    state = WalkState(visited=list(visited), frontier=list(frontier), metrics=metrics)
+            if page is not None:
+                await page.close()
+
+    # One writer per data dir from load to the final save (ids are allocated from what was loaded)
+    with data_lock():
+        orgs = load_orgs()
+        projs = load_projects()
+
+        async with async_playwright() as pw:
+            browser = await pw.chromium.launch(headless=True)
+            context = await browser.new_context()
+
+            try:
+                workers = [asyncio.create_task(_worker(context)) for _ in range(CRAWL_CONCURRENCY)]
+                drained = asyncio.create_task(frontier.join())
+                halted = asyncio.create_task(stopped.wait())
+                await asyncio.wait({drained, halted}, return_when=asyncio.FIRST_COMPLETED)
+                drained.cancel()
+                halted.cancel()
+
+                # Let in-flight visits finish; workers move the rest of the queue to `leftover`
+                stopped.set()
+                for _ in workers:
+                    frontier.put_nowait(None)
+                await asyncio.gather(*workers)
+                while not frontier.empty():  # links pushed by visits that finished after the sentinels
+                    u = frontier.get_nowait()
+                    if u is not None:
+                        leftover.append(u)
+
+            finally:
+                _final_flush()
+                try:
+                    await context.close()
+                finally:
+                    await browser.close()
+
+    metrics.llm_cache_hits = CACHE_STATS["hits"] - cache_base["hits"]
+    metrics.llm_cache_misses = CACHE_STATS["misses"] - cache_base["misses"]
+    logger.info("LLM cache: %d hits, %d misses", metrics.llm_cache_hits, metrics.llm_cache_misses)
+    state = WalkState(visited=list(visited), frontier=leftover, metrics=metrics)
     return state, snapshots
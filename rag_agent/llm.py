@@ -1,17 +1,153 @@
 import os
 import json
-from typing import Any, Dict, List
+import time
+import asyncio
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-from openai import OpenAI
+import orjson
+import tiktoken
+from openai import AsyncOpenAI, OpenAI
 
 from rag_agent.models import Plan, ReflectOutput, Snapshot
 
+logger = logging.getLogger("rag_agent.llm")
 
-def _client() -> OpenAI:
+# Disk cache of chat completions keyed by the full request; LLM_CACHE=0 disables it.
+LLM_CACHE_DIR = Path.cwd() / "data" / "llm_cache"
+
+# Concurrent in-flight async chat requests, and SDK retries (429/5xx, honoring retry-after)
+OAI_CONCURRENCY = max(1, int(os.getenv("OAI_CONCURRENCY", "8")))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+# Input cap for free-form text sent to the model (cost and latency scale with prompt tokens)
+MAX_IN_TOKENS = int(os.getenv("LLM_MAX_IN_TOKENS", "4000"))
+# Markdown token budget of one reflect prompt, shared evenly by its snapshots
+REFLECT_MD_TOKENS = int(os.getenv("LLM_REFLECT_MD_TOKENS", "600"))
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _truncate_tokens(text: str, max_tokens: int, model: str | None = None) -> str:
+    """Cut `text` to at most `max_tokens` tokens of the target model's tokenizer."""
+    enc = _encoding(model or os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    toks = enc.encode(text, disallowed_special=())
+    return text if len(toks) <= max_tokens else enc.decode(toks[:max_tokens])
+
+
+def _api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is not set")
-    return OpenAI(api_key=api_key)
+    return api_key
+
+
+@lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    # One client per process: its httpx pool keeps connections alive across calls.
+    return OpenAI(api_key=_api_key())
+
+
+@lru_cache(maxsize=1)
+def _async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=_api_key(), max_retries=OPENAI_MAX_RETRIES)
+
+
+@lru_cache(maxsize=1)
+def _llm_slots() -> asyncio.Semaphore:
+    return asyncio.Semaphore(OAI_CONCURRENCY)
+
+
+async def _achat(**request: Any) -> str:
+    """One async chat completion, bounded by OAI_CONCURRENCY across the process."""
+    async with _llm_slots():
+        resp = await _async_client().chat.completions.create(**request)
+    usage = resp.usage
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    if details is not None:
+        logger.debug("prompt tokens: %d (cached %d)", usage.prompt_tokens, details.cached_tokens or 0)
+    return resp.choices[0].message.content or "{}"
+
+
+# Process-wide cache counters; the crawler copies them into Metrics at the end of a walk.
+CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def _cache_path(request: Dict[str, Any]) -> Optional[Path]:
+    """Cache file for `request`, or None when caching is disabled (LLM_CACHE=0)."""
+    if os.getenv("LLM_CACHE") == "0":
+        return None
+    key = hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return LLM_CACHE_DIR / f"{key}.json"
+
+
+def _cache_get(path: Optional[Path], check: Callable[[str], object]) -> Optional[str]:
+    if path is None or not path.exists():
+        return None
+    try:
+        content = orjson.loads(path.read_bytes())["content"]
+        check(content)
+    except Exception:
+        return None  # corrupt or unusable entry: caller refreshes it
+    return content
+
+
+def _cache_put(path: Optional[Path], content: str) -> None:
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(orjson.dumps({"content": content}))
+    os.replace(tmp, path)
+
+
+def _cache_put_checked(path: Optional[Path], content: str, check: Callable[[str], object]) -> None:
+    """Cache `content` only if the caller's parser accepts it; a bad reply gets a fresh sample next time."""
+    try:
+        check(content)
+    except Exception:
+        return
+    _cache_put(path, content)
+
+
+def _cached_chat(check: Callable[[str], object], **request: Any) -> str:
+    """
+    Chat completion content for `request`, served from LLM_CACHE_DIR when the exact
+    same (model, messages, temperature, ...) was sent before. `check` is the caller's
+    parser: only replies it accepts (parses without raising) are cached.
+    """
+    path = _cache_path(request)
+    hit = _cache_get(path, check)
+    if hit is not None:
+        CACHE_STATS["hits"] += 1
+        return hit
+    CACHE_STATS["misses"] += 1
+    resp = _client().chat.completions.create(**request)
+    content = resp.choices[0].message.content or "{}"
+    _cache_put_checked(path, content, check)
+    return content
+
+
+async def _acached_chat(check: Callable[[str], object], **request: Any) -> str:
+    """Async twin of _cached_chat on the shared AsyncOpenAI client."""
+    path = _cache_path(request)
+    hit = _cache_get(path, check)
+    if hit is not None:
+        CACHE_STATS["hits"] += 1
+        return hit
+    CACHE_STATS["misses"] += 1
+    content = await _achat(**request)
+    _cache_put_checked(path, content, check)
+    return content
 
 
 def plan_site_walk(url: str) -> Plan:
@@ -26,41 +162,77 @@ def plan_site_walk(url: str) -> Plan:
     )
 
 
+def _top_anchor_texts(s: Snapshot, n: int = 8) -> List[str]:
+    """First `n` distinct (case-insensitive) non-empty anchor texts, cut to 40 chars."""
+    seen = set()
+    out: List[str] = []
+    for a in s.anchors:
+        text = (a.text or "").strip()[:40]
+        if not text or text.lower() in seen:
+            continue
+        seen.add(text.lower())
+        out.append(text)
+        if len(out) >= n:
+            break
+    return out
+
+
 def _format_snapshots(snapshots: List[Snapshot]) -> str:
-    lines: List[str] = []
-    for i, s in enumerate(snapshots, 1):
-        lines.append(f"# Snapshot {i}")
-        lines.append(f"URL: {s.url}")
+    """
+    Compact JSON for the prompt: only signals the model acts on, empty fields omitted.
+    Markdown is cut in tokens, REFLECT_MD_TOKENS split across the snapshots.
+    """
+    share = max(64, REFLECT_MD_TOKENS // max(1, len(snapshots)))
+    items: List[Dict[str, Any]] = []
+    for s in snapshots:
+        item: Dict[str, Any] = {"url": s.url}
         if s.title:
-            lines.append(f"Title: {s.title}")
-        if s.site_name:
-            lines.append(f"Site: {s.site_name}")
-        if s.meta_description:
-            lines.append(f"Meta: {s.meta_description[:300]}")
+            item["title"] = s.title
+        if s.site_name and s.site_name != s.title:
+            item["site"] = s.site_name
+        if s.meta_description and s.meta_description != s.title:
+            item["meta"] = s.meta_description[:240]
         if s.jsonld_objects:
-            lines.append("JSON-LD: present")
-        if s.anchors:
-            top = ", ".join((a.text or "")[:50] for a in s.anchors[:8] if (a.text or "").strip())
-            if top:
-                lines.append(f"Anchors: {top[:300]}")
+            item["jsonld"] = True
+        anchors = _top_anchor_texts(s)
+        if anchors:
+            item["anchors"] = anchors
         if s.markdown:
-            lines.append(f"Markdown preview: {s.markdown[:600]}")
-        lines.append("")
-    return "\n".join(lines)
+            item["md"] = _truncate_tokens(s.markdown, share)
+        items.append(item)
+    return orjson.dumps({"snapshots": items}).decode("utf-8")
+
+
+# Synonyms the model uses for our coverage levels and action types
+_COVERAGE_MAP = {
+    "full": "sufficient",
+    "complete": "sufficient",
+    "enough": "sufficient",
+    "ok": "sufficient",
+    "satisfactory": "sufficient",
+}
+_VALID_COVERAGE = frozenset({"none", "partial", "sufficient"})
+_ACTION_MAP = {
+    "SCROLL_TO_BOTTOM": "SCROLL",
+    "SCROLLDOWN": "SCROLL",
+    "SCROLL-BOTTOM": "SCROLL",
+    "SCROLL_PAGE": "SCROLL",
+    "OPEN-SITEMAP": "OPEN_SITEMAP",
+    "SITEMAP": "OPEN_SITEMAP",
+    "OPEN-ROBOTS": "OPEN_ROBOTS",
+    "ROBOTS": "OPEN_ROBOTS",
+    "VISIT": "GOTO",
+    "NAVIGATE": "GOTO",
+    "OPEN": "GOTO",
+    "GOTO_URL": "GOTO",
+}
 
 
 def _normalize_reflect_payload(raw: Dict[str, Any]) -> Dict[str, Any]:
     # coverage normalization
     cov = str(raw.get("coverage", "")).strip().lower()
-    cov_map = {
-        "full": "sufficient",
-        "complete": "sufficient",
-        "enough": "sufficient",
-        "ok": "sufficient",
-        "satisfactory": "sufficient",
-    }
-    cov = cov_map.get(cov, cov)
-    if cov not in {"none", "partial", "sufficient"}:
+    cov = _COVERAGE_MAP.get(cov, cov)
+    if cov not in _VALID_COVERAGE:
         cov = "partial"
     raw["coverage"] = cov
 
@@ -75,16 +247,8 @@ def _normalize_reflect_payload(raw: Dict[str, Any]) -> Dict[str, Any]:
         if not isinstance(a, dict):
             continue
         t = str(a.get("type", "")).strip().upper()
-        if t in {"SCROLL_TO_BOTTOM", "SCROLLDOWN", "SCROLL-BOTTOM", "SCROLL_PAGE"}:
-            t = "SCROLL"
-        elif t in {"OPEN-SITEMAP", "SITEMAP"}:
-            t = "OPEN_SITEMAP"
-        elif t in {"OPEN-ROBOTS", "ROBOTS"}:
-            t = "OPEN_ROBOTS"
-        elif t in {"VISIT", "NAVIGATE", "OPEN", "GOTO_URL"}:
-            t = "GOTO"
         norm_actions.append({
-            "type": t,
+            "type": _ACTION_MAP.get(t, t),
             "url": a.get("url"),
             "pattern": a.get("pattern"),
             "arg": a.get("arg"),
@@ -97,64 +261,85 @@ def _normalize_reflect_payload(raw: Dict[str, Any]) -> Dict[str, Any]:
     return raw
 
 
-def reflect_and_extract(plan: Plan, snapshots: List[Snapshot]) -> ReflectOutput:
+# Byte-identical across calls so it forms a shared prefix for OpenAI's prompt cache;
+# anything that varies per call goes into the user message.
+STATIC_SYSTEM = (
+    "You are a precise extractor for Ukrainian non-profits and their projects.\n"
+    "- Prefer content in the preferred languages given by the user, in that order.\n"
+    "- Use JSON-LD if present.\n"
+    "- Only include projects that clearly belong to the current organization.\n"
+)
+
+REFLECT_SCHEMA = (
+    "- Return strict JSON with keys: done, coverage, justification, organization, projects, goto_urls, actions.\n"
+    "- coverage MUST be one of: 'none', 'partial', 'sufficient' (use 'sufficient' instead of 'full').\n"
+    "- 'goto_urls' must only contain links that likely list more projects of this same organization.\n"
+    "- 'projects': each item has name, description, source_url.\n"
+    "- 'organization': name, website, contact_email, description.\n"
+)
+
+
+def _parse_reflect(content: str) -> ReflectOutput:
+    """JSON reply -> normalized, validated ReflectOutput; raises ValueError when it doesn't fit."""
+    raw = orjson.loads(content)
+    if not isinstance(raw, dict):
+        raise ValueError("expected a JSON object")
+    return ReflectOutput.model_validate(_normalize_reflect_payload(raw))
+
+
+async def reflect_and_extract(plan: Plan, snapshots: List[Snapshot]) -> ReflectOutput:
     """
     Single reflection step: summarize page(s), extract org/project data, propose new URLs and actions.
-    Robust to minor schema deviations from the model.
+    Robust to minor schema deviations from the model. Identical requests (same model,
+    header and snapshot payload) are answered from LLM_CACHE_DIR without an API call.
     """
-    client = _client()
-    header = (
-        "You are a precise extractor for Ukrainian non-profits and their projects.\n"
-        "- Prefer Ukrainian ('uk') content. English ('en') is acceptable.\n"
-        "- Use JSON-LD if present.\n"
-        "- Only include projects that clearly belong to the current organization.\n"
-        "- Return strict JSON with keys: done, coverage, justification, organization, projects, goto_urls, actions.\n"
-        "- coverage MUST be one of: 'none', 'partial', 'sufficient' (use 'sufficient' instead of 'full').\n"
-        "- 'goto_urls' must only contain links that likely list more projects of this same organization.\n"
-        "- 'projects': each item has name, description, source_url.\n"
-        "- 'organization': name, website, contact_email, description.\n"
-    )
-    user = _format_snapshots(snapshots)
+    langs = ", ".join(f"'{l}'" for l in plan.prefer_languages) or "'uk'"
+    user = f"Preferred content languages, in order: {langs}.\n\n" + _format_snapshots(snapshots)
 
-    resp = client.chat.completions.create(
+    request = dict(
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         temperature=0.2,
+        seed=0,
         response_format={"type": "json_object"},
         messages=[
-            {"role": "system", "content": header},
+            {"role": "system", "content": STATIC_SYSTEM},
+            {"role": "system", "content": REFLECT_SCHEMA},
             {"role": "user", "content": user},
         ],
     )
-    content = resp.choices[0].message.content or "{}"
-
-    # Parse JSON safely; normalize to our schema; then validate.
+    content = await _acached_chat(_parse_reflect, **request)
     try:
-        raw = json.loads(content)
-    except Exception:
-        # handle accidental code fences or stray text
-        text = content.strip().strip("```").strip()
-        raw = json.loads(text) if text.startswith("{") else {}
+        return _parse_reflect(content)
+    except ValueError as e:  # JSONDecodeError and pydantic's ValidationError
+        err = str(e)[:500]
+    logger.info("Reflect reply failed the schema, reprompting once: %s", err)
 
-    raw = _normalize_reflect_payload(raw)
-    return ReflectOutput.model_validate(raw)
+    request["messages"] = request["messages"] + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": f"Previous response failed schema: {err}. Return JSON matching the schema strictly."},
+    ]
+    return _parse_reflect(await _acached_chat(_parse_reflect, **request))
 
 
-def expand_to_ua_description(short_text: str, site_markdown: str | None = None, min_chars: int = 600) -> str:
-    """
-    Expand a short project/org blurb into a cohesive Ukrainian paragraph >= min_chars.
-    """
-    client = _client()
+async def reflect_and_extract_many(plan: Plan, snapshot_batches: Sequence[List[Snapshot]]) -> List[ReflectOutput]:
+    """Reflect several snapshot batches concurrently (bounded by OAI_CONCURRENCY); keeps input order."""
+    return list(await asyncio.gather(*(reflect_and_extract(plan, b) for b in snapshot_batches)))
+
+
+def _expand_request(short_text: str, site_markdown: str | None, min_chars: int) -> Dict[str, Any]:
     prompt = (
         "Розшир цю коротку анотацію до змістовного опису українською мовою. "
         f"Мінімум {min_chars} символів, один зв'язний абзац, без рекомендацій і без вигадування фактів."
     )
-    given = f"Короткий текст:\n{short_text.strip()}\n\n"
+    given = f"Короткий текст:\n{_truncate_tokens(short_text.strip(), MAX_IN_TOKENS)}\n\n"
     if site_markdown:
         given += f"Контекст сторінки (витяг):\n{(site_markdown or '')[:1200]}\n"
 
-    resp = client.chat.completions.create(
+    return dict(
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         temperature=0.2,
+        # Room for a few times min_chars of Cyrillic; a cut-off JSON answer would be wasted
+        max_tokens=max(1200, min_chars),
         response_format={"type": "json_object"},
         messages=[
             {"role": "system", "content": "Return JSON: {\"text\": \"...\"}"},
@@ -162,10 +347,115 @@ def expand_to_ua_description(short_text: str, site_markdown: str | None = None,
         ],
     )
 
-    content = resp.choices[0].message.content or "{}"
+
+def _parse_expanded(content: str) -> str:
+    """JSON reply -> expanded text; raises ValueError when it is unparseable (e.g. cut off) or empty."""
+    data = orjson.loads(content)
+    text = data.get("text") if isinstance(data, dict) else None
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("reply has no 'text'")
+    return text.strip()
+
+
+def _expanded_text(content: str, short_text: str) -> str:
+    try:
+        return _parse_expanded(content)
+    except ValueError:
+        return short_text
+
+
+def expand_to_ua_description(short_text: str, site_markdown: str | None = None, min_chars: int = 600) -> str:
+    """
+    Expand a short project/org blurb into a cohesive Ukrainian paragraph >= min_chars.
+    """
+    content = _cached_chat(_parse_expanded, **_expand_request(short_text, site_markdown, min_chars))
+    return _expanded_text(content, short_text)
+
+
+async def expand_to_ua_description_async(short_text: str, site_markdown: str | None = None, min_chars: int = 600) -> str:
+    """Non-blocking expand_to_ua_description; falls back to the short text on any error."""
     try:
-        data = json.loads(content)
-        text = data.get("text", "").strip()
-        return text or short_text
+        content = await _acached_chat(_parse_expanded, **_expand_request(short_text, site_markdown, min_chars))
     except Exception:
         return short_text
+    return _expanded_text(content, short_text)
+
+
+async def expand_many(items: Sequence[Tuple[str, str | None]], min_chars: int = 600) -> List[str]:
+    """Expand (short_text, site_markdown) pairs concurrently; results keep input order."""
+    return list(await asyncio.gather(
+        *(expand_to_ua_description_async(text, md, min_chars) for text, md in items)
+    ))
+
+
+BATCH_MIN_ITEMS = 5      # below this the Batch API's turnaround isn't worth it
+BATCH_POLL_S = 30
+BATCH_TIMEOUT_S = 24 * 3600
+
+
+def expand_descriptions_batch(
+    items: Sequence[Tuple[str, str, str | None]],
+    min_chars: int = 600,
+    poll_s: float = BATCH_POLL_S,
+) -> Dict[str, str]:
+    """
+    Expand many (id, short_text, site_markdown) blurbs through the OpenAI Batch API
+    (half price, no per-minute rate pressure, minutes-to-hours turnaround).
+    Cached items are answered locally; short lists use the synchronous path.
+    Returns {str(id): text}; items the batch could not answer keep their short text.
+    """
+    out: Dict[str, str] = {}
+    pending: Dict[str, Tuple[str, Dict[str, Any], Optional[Path]]] = {}
+    for item_id, short_text, md in items:
+        request = _expand_request(short_text, md, min_chars)
+        path = _cache_path(request)
+        hit = _cache_get(path, _parse_expanded)
+        if hit is not None:
+            out[str(item_id)] = _expanded_text(hit, short_text)
+        else:
+            pending[str(item_id)] = (short_text, request, path)
+
+    if len(pending) < BATCH_MIN_ITEMS:
+        for item_id, (short_text, request, _) in pending.items():
+            out[item_id] = _expanded_text(_cached_chat(_parse_expanded, **request), short_text)
+        return out
+
+    client = _client()
+    lines = [
+        json.dumps({"custom_id": cid, "method": "POST", "url": "/v1/chat/completions", "body": req},
+                   ensure_ascii=False)
+        for cid, (_, req, _) in pending.items()
+    ]
+    upload = client.files.create(file=("expand.jsonl", ("\n".join(lines) + "\n").encode("utf-8")), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+    )
+    logger.info("Submitted expansion batch %s (%d requests)", batch.id, len(pending))
+
+    waited = 0.0
+    while batch.status not in {"completed", "failed", "expired", "cancelled"}:
+        if waited >= BATCH_TIMEOUT_S:
+            raise TimeoutError(f"Batch {batch.id} still {batch.status} after {waited:.0f}s")
+        time.sleep(poll_s)
+        waited += poll_s
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            row = orjson.loads(line)
+            cid = row.get("custom_id")
+            if cid not in pending or (row.get("response") or {}).get("status_code") != 200:
+                continue
+            content = row["response"]["body"]["choices"][0]["message"]["content"] or "{}"
+            short_text, _, path = pending[cid]
+            _cache_put_checked(path, content, _parse_expanded)
+            out[cid] = _expanded_text(content, short_text)
+
+    missing = [cid for cid in pending if cid not in out]
+    if missing:
+        logger.warning("Batch %s ended %s; %d items left unexpanded", batch.id, batch.status, len(missing))
+        for cid in missing:
+            out[cid] = pending[cid][0]
+    return out
@@ -1,29 +1,47 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+_listener: QueueListener | None = None
 
 
 def setup_logging() -> None:
     """
     Minimal, quiet-by-default logging with optional file output.
+    Records go through a queue; a background listener thread does the console/file I/O,
+    so logging never blocks the event loop or parse threads. Safe to call more than once.
     Env:
       LOG_LEVEL=INFO|DEBUG|WARNING (default INFO)
       LOG_TO_FILE=1 to also write data/run.log with rotation
     """
+    global _listener
+    if _listener is not None:
+        return
+
     lvl = os.getenv("LOG_LEVEL", "INFO").upper()
     lvl = getattr(logging, lvl, logging.INFO)
 
-    fmt = "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
-    logging.basicConfig(level=lvl, format=fmt)
+    fmt = logging.Formatter("%(asctime)s | %(levelname)-8s | %(name)s | %(message)s")
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if os.getenv("LOG_TO_FILE") == "1":
+        handlers.append(RotatingFileHandler(
+            "data/run.log", maxBytes=2_000_000, backupCount=3, encoding="utf-8"
+        ))
+    for h in handlers:
+        h.setLevel(lvl)
+        h.setFormatter(fmt)
+
+    q: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(lvl)
+    root.addHandler(QueueHandler(q))
 
     # Keep Playwright chatty logs down
     for noisy in ("asyncio", "playwright", "httpx", "urllib3"):
         logging.getLogger(noisy).setLevel(max(lvl, logging.WARNING))
 
-    if os.getenv("LOG_TO_FILE") == "1":
-        fh = RotatingFileHandler(
-            "data/run.log", maxBytes=2_000_000, backupCount=3, encoding="utf-8"
-        )
-        fh.setLevel(lvl)
-        fh.setFormatter(logging.Formatter(fmt))
-        logging.getLogger().addHandler(fh)
+    _listener = QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush queued records on exit
@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import List, Optional, Literal, Dict, Any
-from pydantic import BaseModel, Field, HttpUrl, validator
+from collections import deque
+from typing import Deque, List, Optional, Literal, Dict, Any
+from pydantic import BaseModel, Field, HttpUrl, PrivateAttr, validator
 
 
 class BudgetHard(BaseModel):
@@ -57,21 +58,29 @@ class Metrics(BaseModel):
     pages_visited: int = 0
     frontier_size: int = 0
     new_in_window: int = 0
-    window_actions: List[int] = Field(default_factory=list)   # rolling window of actions per step
-    window_new: List[int] = Field(default_factory=list)       # rolling window of discovered links per step
+    llm_cache_hits: int = 0
+    llm_cache_misses: int = 0
+    window_actions: Deque[int] = Field(default_factory=deque)   # rolling window of actions per step
+    window_new: Deque[int] = Field(default_factory=deque)       # rolling window of discovered links per step
+    _sum_actions: int = PrivateAttr(default=0)  # running sums of the two windows
+    _sum_new: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._sum_actions = sum(self.window_actions)
+        self._sum_new = sum(self.window_new)
 
     def push_window(self, actions: int, new_links: int, window: int) -> None:
         self.window_actions.append(actions)
         self.window_new.append(new_links)
-        if len(self.window_actions) > window:
-            self.window_actions.pop(0)
-            self.window_new.pop(0)
+        self._sum_actions += actions
+        self._sum_new += new_links
+        while len(self.window_actions) > window:
+            self._sum_actions -= self.window_actions.popleft()
+            self._sum_new -= self.window_new.popleft()
 
     @property
     def frontier_new_ratio(self) -> float:
-        a = sum(self.window_actions) or 1
-        n = sum(self.window_new)
-        return n / a
+        return self._sum_new / (self._sum_actions or 1)
 
 
 class WalkState(BaseModel):
@@ -1,17 +1,28 @@
 from __future__ import annotations
+import asyncio
+import os
 import re, json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
 from urllib.parse import urlparse, urljoin
-from extruct import extract
-from w3lib.html import get_base_url
-import trafilatura
-from readability import Document
-from markdownify import markdownify as _md
+import lxml.html
+import orjson
+# extruct, w3lib, trafilatura, readability and markdownify are imported where used: they are
+# heavy to load and, after the single-parse path, only needed on fallbacks and for markdown.
+
+# Page parsing is CPU-bound; the crawler runs it here so the event loop keeps serving
+# other workers and in-flight LLM calls. lxml releases the GIL while it parses.
+_PARSE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="parse")
 
 EMAIL_RE = re.compile(r'[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}', re.I)
-A_TAG_RE = re.compile(r"<a\s+[^>]*href=[\"']([^\"'#]+)[\"'][^>]*>(.*?)</a>", re.I | re.S)
+WS_RE = re.compile(r"\s+")
+_UTF8_PARSER = lxml.html.HTMLParser(encoding="utf-8")
 
 
+# Hosts and hrefs repeat heavily across a crawl (nav/footer links on every page).
+@lru_cache(maxsize=200_000)
 def canonical_host(url: str) -> Optional[str]:
     try:
         netloc = urlparse(url).netloc.lower()
@@ -27,6 +38,7 @@ def same_site(u: str, root: str) -> bool:
     return bool(cu and cr and (cu == cr or cu.endswith("." + cr) or cr.endswith("." + cu)))
 
 
+@lru_cache(maxsize=200_000)
 def normalize_url(base: str, href: str) -> Optional[str]:
     try:
         return urljoin(base, href.strip())
@@ -34,7 +46,10 @@ def normalize_url(base: str, href: str) -> Optional[str]:
         return None
 
 
-def extract_jsonld_objects(html: str, url: str) -> List[Dict[str, Any]]:
+def _jsonld_extruct(html: str, url: str) -> List[Dict[str, Any]]:
+    from extruct import extract
+    from w3lib.html import get_base_url
+
     try:
         base = get_base_url(html, url)
         data = extract(html, base_url=base, syntaxes=["json-ld"]).get("json-ld", [])
@@ -48,12 +63,50 @@ def extract_jsonld_objects(html: str, url: str) -> List[Dict[str, Any]]:
         return []
 
 
-def extract_anchors(html: str, base_url: str, limit: int = 200) -> List[Dict[str, str]]:
+def extract_jsonld_objects(html: str, url: str, tree=None) -> List[Dict[str, Any]]:
+    """
+    JSON-LD objects (with @graph flattened) read straight from the ld+json <script> blocks
+    of `tree`; falls back to extruct when the page won't parse or a block isn't strict JSON.
+    """
+    if tree is None:
+        tree = parse_html(html)
+    if tree is None:
+        return _jsonld_extruct(html, url)
+    out: List[Dict[str, Any]] = []
+    for node in tree.iter("script"):
+        if (node.get("type") or "").strip().lower() != "application/ld+json":
+            continue
+        text = (node.text or "").strip()
+        if not text:
+            continue
+        try:
+            data = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return _jsonld_extruct(html, url)  # comments, trailing commas, ...: let extruct cope
+        for obj in data if isinstance(data, list) else [data]:
+            if not isinstance(obj, dict):
+                continue
+            graph = obj.get("@graph")
+            if isinstance(graph, list):
+                out.extend(g for g in graph if isinstance(g, dict))
+            else:
+                out.append(obj)
+    return out[:50]
+
+
+def extract_anchors(html: str, base_url: str, limit: int = 200, tree=None) -> List[Dict[str, str]]:
+    """Unique absolute links with their text; pass `tree` (parse_html) to reuse an existing parse."""
+    if tree is None:
+        tree = parse_html(html)
+    if tree is None:
+        return []
     out: List[Dict[str, str]] = []
     seen = set()
-    for m in A_TAG_RE.finditer(html or ""):
-        href = m.group(1).strip()
-        text = re.sub(r"\s+", " ", (m.group(2) or "").strip())
+    for a in tree.iter("a"):
+        href = (a.get("href") or "").split("#", 1)[0].strip()
+        if not href:
+            continue  # missing, empty or fragment-only link
+        text = WS_RE.sub(" ", a.text_content()).strip()
         absu = normalize_url(base_url, href)
         if not absu or absu in seen:
             continue
@@ -64,17 +117,25 @@ def extract_anchors(html: str, base_url: str, limit: int = 200) -> List[Dict[str
     return out
 
 
-def html_to_markdown(html: str) -> str:
-    """Readable markdown: trafilatura -> readability -> markdownify fallback."""
+def html_to_markdown(html: str, tree=None) -> str:
+    """
+    Readable markdown: trafilatura -> readability -> markdownify fallback.
+    trafilatura reuses `tree` when given; it prunes the tree in place, so pass it last.
+    """
     if not html:
         return ""
+    import trafilatura
+
     try:
-        txt = trafilatura.extract(html, include_comments=False) or ""
+        txt = trafilatura.extract(tree if tree is not None else html, include_comments=False) or ""
         if len(txt.strip()) >= 150:
             return txt.strip()
     except Exception:
         pass
 
+    from readability import Document
+    from markdownify import markdownify as _md
+
     try:
         d = Document(html)
         content = d.summary(html_partial=True)
@@ -87,17 +148,42 @@ def html_to_markdown(html: str) -> str:
             return ""
 
 
-def bootstrap_site_hints(url: str, html: str) -> Dict[str, Any]:
-    """Lightweight hints: title/meta/og, best-guess email."""
-    title_m = re.search(r"<title[^>]*>(.*?)</title>", html or "", re.I | re.S)
-    title = (title_m.group(1) or "").strip() if title_m else None
+def parse_html(html: str):
+    """One lxml parse of the page (C parser), or None if it is empty/unparseable."""
+    if not html or not html.strip():
+        return None
+    try:
+        try:
+            return lxml.html.document_fromstring(html)
+        except ValueError:
+            # str input with an XML encoding declaration: hand lxml the bytes instead
+            return lxml.html.document_fromstring(html.encode("utf-8"), parser=_UTF8_PARSER)
+    except Exception:
+        return None
 
-    def _meta(name: str) -> Optional[str]:
-        m = re.search(rf'<meta[^>]+name=["\']{re.escape(name)}["\'][^>]+content=["\'](.*?)["\']', html or "", re.I)
-        if m:
-            return (m.group(1) or "").strip()
-        m = re.search(rf'<meta[^>]+property=["\']{re.escape(name)}["\'][^>]+content=["\'](.*?)["\']', html or "", re.I)
-        return (m.group(1) or "").strip() if m else None
+
+def _head_info(tree) -> tuple[Optional[str], Dict[str, str]]:
+    """(title, metas) from a single walk; metas maps lowercased name/property -> first content seen."""
+    if tree is None:
+        return None, {}
+    title_el = tree.find(".//title")
+    title = title_el.text_content().strip() if title_el is not None else None
+    metas: Dict[str, str] = {}
+    for m in tree.iter("meta"):
+        content = m.get("content")
+        if content is None:
+            continue
+        for attr in ("name", "property"):
+            key = (m.get(attr) or "").strip().lower()
+            if key:
+                metas.setdefault(key, content.strip())
+    return title, metas
+
+
+def bootstrap_site_hints(url: str, html: str, tree=None) -> Dict[str, Any]:
+    """Lightweight hints: title/meta/og, best-guess email. `tree` reuses an existing parse."""
+    title, metas = _head_info(tree if tree is not None else parse_html(html))
+    _meta = metas.get
 
     site_name = _meta("og:site_name") or _meta("twitter:site") or canonical_host(url)
     description = _meta("description") or _meta("og:description") or _meta("twitter:description")
@@ -111,3 +197,38 @@ def bootstrap_site_hints(url: str, html: str) -> Dict[str, Any]:
         "meta_description": description,
         "best_email": best_email,
     }
+
+
+@dataclass
+class ParsedPage:
+    """Everything the crawler reads from one page, derived from a single lxml parse."""
+    url: str
+    title: Optional[str] = None
+    site_name: Optional[str] = None
+    meta_description: Optional[str] = None
+    best_email: Optional[str] = None
+    anchors: List[Dict[str, str]] = field(default_factory=list)
+    jsonld: List[Dict[str, Any]] = field(default_factory=list)
+    markdown: str = ""
+
+
+def parse_once(html: str, url: str, anchor_limit: int = 200) -> ParsedPage:
+    """Parse `html` once and run every extractor against that tree."""
+    tree = parse_html(html)
+    hints = bootstrap_site_hints(url, html, tree=tree)
+    page = ParsedPage(
+        url=url,
+        title=hints["title"],
+        site_name=hints["site_name"],
+        meta_description=hints["meta_description"],
+        best_email=hints["best_email"],
+        anchors=extract_anchors(html, url, limit=anchor_limit, tree=tree),
+        jsonld=extract_jsonld_objects(html, url, tree=tree),
+    )
+    page.markdown = html_to_markdown(html, tree=tree)  # last: trafilatura mutates the tree
+    return page
+
+
+async def parse_page_async(html: str, url: str) -> ParsedPage:
+    """parse_once on _PARSE_POOL, awaitable from the crawler."""
+    return await asyncio.get_running_loop().run_in_executor(_PARSE_POOL, parse_once, html, url)
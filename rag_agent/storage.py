@@ -1,10 +1,17 @@
 from __future__ import annotations
-import json
+import bisect
+import hashlib
 import logging
+import mmap
 import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
 
 from rag_agent.models import OrganizationOut, ProjectOut
 from rag_agent.llm import expand_to_ua_description
@@ -18,6 +25,17 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 ORG_PATH = (DATA_DIR / "organizations.json").resolve()
 PROJ_PATH = (DATA_DIR / "projects.json").resolve()
 
+# Append-only change logs: one JSON record per line, replayed over the snapshot on load
+# and folded into it (then removed) by save_orgs/save_projects.
+ORG_LOG = ORG_PATH.with_suffix(".jsonl")
+PROJ_LOG = PROJ_PATH.with_suffix(".jsonl")
+
+# One line per snapshot rewrite: {ts, path, sha256, bytes, mode}
+JOURNAL_PATH = (DATA_DIR / ".journal.jsonl").resolve()
+
+# Held by data_lock() from load to the final save
+LOCK_PATH = (DATA_DIR / ".lock").resolve()
+
 
 # ---------- utils ----------
 def now_iso() -> str:
@@ -28,8 +46,7 @@ def _load_json_list(path: Path) -> List[Dict]:
     if not path.exists():
         return []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = orjson.loads(path.read_bytes())
         if isinstance(data, list):
             return data
         logger.warning("File %s did not contain a list, resetting.", path)
@@ -39,76 +56,403 @@ def _load_json_list(path: Path) -> List[Dict]:
         return []
 
 
-def _atomic_write(path: Path, payload: List[Dict]) -> None:
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    tmp.parent.mkdir(parents=True, exist_ok=True)
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
+def _append_jsonl(path: Path, records: Iterable[Dict]) -> Optional[Tuple[int, int]]:
+    """Append one line per record; returns the (start, end) byte offsets written, None if nothing was."""
+    lines = b"".join(orjson.dumps(r, option=orjson.OPT_NON_STR_KEYS) + b"\n" for r in records)
+    if not lines:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab+") as f:
+        start = f.tell()
+        if start:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                lines = b"\n" + lines  # end the torn line a crash left, don't glue onto it
+        f.write(lines)
+    return start, start + len(lines)
+
+
+def _replay_jsonl(records: List[Dict], path: Path, id_key: str) -> Tuple[List[Dict], int]:
+    """
+    Apply logged records over `records`: the last line per id wins, unknown ids are appended.
+    Returns (records, bytes of the log replayed).
+    """
+    if not path.exists():
+        return records, 0
+    pos = {r.get(id_key): i for i, r in enumerate(records)}
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return records, 0
+        # mmap: lines are sliced straight from the page cache, the log is never read into one buffer
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                if not line.strip():
+                    continue
+                try:
+                    rec = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    logger.warning("Skipping torn line in %s", path)  # crash mid-append
+                    continue
+                i = pos.get(rec.get(id_key))
+                if i is None:
+                    pos[rec.get(id_key)] = len(records)
+                    records.append(rec)
+                else:
+                    records[i] = rec
+    return records, size
+
+
+def _fold_log(path: Path, folded: Optional[int]) -> None:
+    """
+    Drop the first `folded` bytes of a change log that a snapshot now contains; lines appended
+    after them are kept for the next load. `folded=None` keeps the whole log (replaying lines
+    already in the snapshot is harmless).
+    """
+    if folded is None:
+        return
+    size = path.stat().st_size if path.exists() else 0
+    if size <= folded:
+        path.unlink(missing_ok=True)
+        return
+    with open(path, "rb") as f:
+        f.seek(folded)
+        tail = f.read()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+
+@contextmanager
+def data_lock() -> Iterator[None]:
+    """
+    Exclusive lock on DATA_DIR for a whole load -> save cycle (crawl, expand, compact).
+    Stores allocate ids from what they loaded, so two concurrent writers would hand out the same
+    ids and one snapshot rewrite would drop the other's records. Raises RuntimeError if held.
+    """
+    f = open(LOCK_PATH, "a+b")
+    try:
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RuntimeError(f"{DATA_DIR} is in use by another crawl/expand/compact ({LOCK_PATH})") from None
+        yield
+    finally:
+        f.close()  # releases the lock
+
+
+def _file_sha256(path: Path) -> Optional[str]:
+    return hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else None
+
+
+def _fsync_dir(path: Path) -> None:
+    """Persist a rename in `path` (POSIX); directories can't be opened for this on Windows."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path: Path, payload: List[Dict], expected_prev_sha256: Optional[str] = None) -> str:
+    """
+    Replace `path` with `payload` via an exclusively created temp file + os.replace and record
+    the write in JOURNAL_PATH. With `expected_prev_sha256`, refuse (RuntimeError) if the file on
+    disk is no longer the version the caller loaded. Returns the sha256 of the new contents.
+    """
+    data = orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    if expected_prev_sha256 is not None and _file_sha256(path) != expected_prev_sha256:
+        raise RuntimeError(f"{path} was changed by another writer since it was loaded")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")  # O_EXCL
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())  # contents durable before the rename makes them visible
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+    digest = hashlib.sha256(data).hexdigest()
+    _append_jsonl(JOURNAL_PATH, [{"ts": now_iso(), "path": str(path), "sha256": digest, "bytes": len(data), "mode": "replace"}])
+    return digest
+
+
+# ---------- stores ----------
+def _key(value: str | None) -> str:
+    return (value or "").strip().lower()
+
+
+class _Store(ABC):
+    """
+    Records list plus hashed lookups; subclasses define the index keys and the file.
+    Each key maps to every record having it, in list order, so find() returns the same record
+    a front-to-back scan would, also after updates move records between keys.
+    """
+
+    id_key = ""  # record field holding the integer id
+
+    def __init__(self, records: List[Dict] | None = None, sha256: Optional[str] = None, log_bytes: Optional[int] = 0):
+        self.records: List[Dict] = records if records is not None else []
+        self.sha256 = sha256   # snapshot file version this store was loaded from
+        self.dirty = bool(log_bytes)  # records ahead of the snapshot file (a replayed change log counts)
+        self.log_bytes: Optional[int] = log_bytes  # change-log prefix reflected in records (None: unknown)
+        self.next_id = max((r.get(self.id_key) or 0 for r in self.records), default=0) + 1
+        self._pos: Dict[int, int] = {id(r): i for i, r in enumerate(self.records)}  # list position per record
+        for r in self.records:
+            self._index(r)
+
+    def __len__(self) -> int:
+        return len(self.records)
 
+    def __iter__(self):
+        return iter(self.records)
 
-def load_orgs() -> List[Dict]:
-    return _load_json_list(ORG_PATH)
+    @abstractmethod
+    def _keys(self, r: Dict) -> List[Tuple[Dict, object]]:
+        """(index, key) pairs under which `r` is findable."""
 
+    def _index(self, r: Dict) -> None:
+        for idx, k in self._keys(r):
+            bisect.insort(idx.setdefault(k, []), r, key=lambda x: self._pos[id(x)])
 
-def save_orgs(orgs: List[Dict]) -> None:
-    logger.info("Saving %d records to %s", len(orgs), ORG_PATH)
-    _atomic_write(ORG_PATH, orgs)
+    def _unindex(self, r: Dict) -> None:
+        for idx, k in self._keys(r):
+            bucket = idx.get(k) or []
+            for i, x in enumerate(bucket):
+                if x is r:
+                    del bucket[i]
+                    break
+            if not bucket:
+                idx.pop(k, None)
 
+    def find(self, idx: Dict[object, List[Dict]], key: object) -> Optional[Dict]:
+        """First record (in list order) stored under `key` in `idx`."""
+        bucket = idx.get(key)
+        return bucket[0] if bucket else None
 
-def load_projects() -> List[Dict]:
-    return _load_json_list(PROJ_PATH)
+    def update(self, r: Dict, **fields) -> None:
+        """Set fields on a stored record, keeping the indices in sync."""
+        self._unindex(r)
+        r.update(fields)
+        self._index(r)
+        self.dirty = True
 
+    def new_id(self) -> int:
+        """Reserve the next free id."""
+        nid = self.next_id
+        self.next_id += 1
+        return nid
 
-def save_projects(projects: List[Dict]) -> None:
-    logger.info("Saving %d records to %s", len(projects), PROJ_PATH)
-    _atomic_write(PROJ_PATH, projects)
+    def add(self, r: Dict) -> None:
+        self._pos[id(r)] = len(self.records)
+        self.records.append(r)
+        self._index(r)
+        self.next_id = max(self.next_id, (r.get(self.id_key) or 0) + 1)
+        self.dirty = True
+
+    def logged(self, span: Optional[Tuple[int, int]]) -> None:
+        """Account for lines this store appended to its change log at byte offsets `span`."""
+        if span is None:
+            return
+        start, end = span
+        # Anything between our last known offset and `start` was written by someone else
+        self.log_bytes = end if self.log_bytes == start else None
+
+    def mark_dirty(self) -> None:
+        """Flag records changed outside update()/add() (e.g. a description set in place)."""
+        self.dirty = True
+
+    @abstractmethod
+    def _save(self, expected_prev_sha256: Optional[str]) -> str:
+        """Write the snapshot; return its sha256."""
+
+    def flush(self) -> None:
+        """Write the snapshot if anything changed, refusing to clobber another writer's version."""
+        if self.dirty:
+            self.sha256 = self._save(self.sha256)
+            self.dirty = False
+
+
+class OrgStore(_Store):
+    """Organizations list plus hashed lookups by website and by name (first record wins)."""
+
+    id_key = "organization_id"
+
+    def __init__(self, records: List[Dict] | None = None, sha256: Optional[str] = None, log_bytes: Optional[int] = 0):
+        self.by_website: Dict[str, List[Dict]] = {}
+        self.by_name: Dict[str, List[Dict]] = {}
+        super().__init__(records, sha256, log_bytes)
+
+    def _keys(self, o: Dict) -> List[Tuple[Dict, object]]:
+        keys: List[Tuple[Dict, object]] = [(self.by_name, _key(o.get("name")))]
+        if _key(o.get("website")):
+            keys.append((self.by_website, _key(o.get("website"))))
+        return keys
+
+    def _save(self, expected_prev_sha256: Optional[str]) -> str:
+        return save_orgs(self, expected_prev_sha256=expected_prev_sha256)
+
+
+class ProjectStore(_Store):
+    """Projects list plus hashed lookups by source_url and by (organization_id, name)."""
+
+    id_key = "project_id"
+
+    def __init__(self, records: List[Dict] | None = None, sha256: Optional[str] = None, log_bytes: Optional[int] = 0):
+        self.by_source_url: Dict[str, List[Dict]] = {}
+        self.by_org_name: Dict[Tuple[int, str], List[Dict]] = {}
+        super().__init__(records, sha256, log_bytes)
+
+    def _keys(self, p: Dict) -> List[Tuple[Dict, object]]:
+        keys: List[Tuple[Dict, object]] = [(self.by_org_name, (p.get("organization_id"), _key(p.get("name"))))]
+        if _key(p.get("source_url")):
+            keys.append((self.by_source_url, _key(p.get("source_url"))))
+        return keys
+
+    def _save(self, expected_prev_sha256: Optional[str]) -> str:
+        return save_projects(self, expected_prev_sha256=expected_prev_sha256)
+
+
+def load_orgs() -> OrgStore:
+    sha = _file_sha256(ORG_PATH)
+    records, log_bytes = _replay_jsonl(_load_json_list(ORG_PATH), ORG_LOG, "organization_id")
+    return OrgStore(records, sha256=sha, log_bytes=log_bytes)
+
+
+def append_orgs(records: Iterable[Dict], orgs: Optional[OrgStore] = None) -> None:
+    """Log changed/new organizations without rewriting organizations.json; pass the store that holds them."""
+    span = _append_jsonl(ORG_LOG, records)
+    if orgs is not None:
+        orgs.logged(span)
+
+
+def save_orgs(orgs: OrgStore | List[Dict], expected_prev_sha256: Optional[str] = None) -> str:
+    """
+    Write the full snapshot and drop the part of the change log it now contains (compaction).
+    A bare list is taken to contain the whole log.
+    """
+    if isinstance(orgs, OrgStore):
+        records, folded = orgs.records, orgs.log_bytes
+    else:
+        records, folded = orgs, (ORG_LOG.stat().st_size if ORG_LOG.exists() else 0)
+    logger.info("Saving %d records to %s", len(records), ORG_PATH)
+    digest = _atomic_write(ORG_PATH, records, expected_prev_sha256)
+    _fold_log(ORG_LOG, folded)
+    if isinstance(orgs, OrgStore) and folded is not None:
+        orgs.log_bytes = 0  # what is left of the log was never read into this store
+    return digest
+
+
+def load_projects() -> ProjectStore:
+    sha = _file_sha256(PROJ_PATH)
+    records, log_bytes = _replay_jsonl(_load_json_list(PROJ_PATH), PROJ_LOG, "project_id")
+    return ProjectStore(records, sha256=sha, log_bytes=log_bytes)
+
+
+def append_projects(records: Iterable[Dict], projects: Optional[ProjectStore] = None) -> None:
+    """Log changed/new projects without rewriting projects.json; pass the store that holds them."""
+    span = _append_jsonl(PROJ_LOG, records)
+    if projects is not None:
+        projects.logged(span)
+
+
+def save_projects(projects: ProjectStore | List[Dict], expected_prev_sha256: Optional[str] = None) -> str:
+    """
+    Write the full snapshot and drop the part of the change log it now contains (compaction).
+    A bare list is taken to contain the whole log.
+    """
+    if isinstance(projects, ProjectStore):
+        records, folded = projects.records, projects.log_bytes
+    else:
+        records, folded = projects, (PROJ_LOG.stat().st_size if PROJ_LOG.exists() else 0)
+    logger.info("Saving %d records to %s", len(records), PROJ_PATH)
+    digest = _atomic_write(PROJ_PATH, records, expected_prev_sha256)
+    _fold_log(PROJ_LOG, folded)
+    if isinstance(projects, ProjectStore) and folded is not None:
+        projects.log_bytes = 0  # what is left of the log was never read into this store
+    return digest
 
 
 # ---------- upserts ----------
-def upsert_org(orgs: List[Dict], payload: OrganizationOut) -> Dict:
+def upsert_org(orgs: OrgStore | List[Dict], payload: OrganizationOut) -> Dict:
+    """
+    Update the org matching by website, else by name (first in list order), else create one.
+
+    >>> orgs = OrgStore()
+    >>> for n, w in [("Foo", "w1"), ("Bar", "w2"), ("Foo", "w2"), ("Baz", "w1")]:
+    ...     _ = upsert_org(orgs, OrganizationOut(name=n, website=w))
+    >>> upsert_org(orgs, OrganizationOut(name="Foo"))["organization_id"]
+    2
+    """
+    if not isinstance(orgs, OrgStore):
+        orgs = OrgStore(orgs)  # plain list: index it once for this call
     name = (payload.name or "").strip()
     website = (payload.website or "").strip() or None
 
+    def _enrich() -> Dict:
+        fields = {}
+        if payload.description:
+            fields["description"] = payload.description
+        if payload.contact_email:
+            fields["contact_email"] = payload.contact_email
+        return fields
+
     # 1) match by website (preferred)
-    if website:
-        for o in orgs:
-            if (o.get("website") or "").strip().lower() == website.lower():
-                # update in place (non-destructive)
-                o["name"] = name or o.get("name") or ""
-                if payload.description:
-                    o["description"] = payload.description
-                if payload.contact_email:
-                    o["contact_email"] = payload.contact_email
-                return o
+    o = orgs.find(orgs.by_website, website.lower()) if website else None
+    if o is not None:
+        # update in place (non-destructive)
+        orgs.update(o, name=name or o.get("name") or "", **_enrich())
+        return o
 
     # 2) match by name (fallback)
-    for o in orgs:
-        if (o.get("name") or "").strip().lower() == name.lower():
-            if payload.website:
-                o["website"] = payload.website
-            if payload.description:
-                o["description"] = payload.description
-            if payload.contact_email:
-                o["contact_email"] = payload.contact_email
-            return o
+    o = orgs.find(orgs.by_name, name.lower())
+    if o is not None:
+        fields = _enrich()
+        if payload.website:
+            fields["website"] = payload.website
+        orgs.update(o, **fields)
+        return o
 
     # 3) create
-    new_id = max([o.get("organization_id", 0) for o in orgs], default=0) + 1
     rec = {
-        "organization_id": new_id,
+        "organization_id": orgs.new_id(),
         "name": name,
         "description": payload.description or "",
         "website": payload.website or "",
         "contact_email": payload.contact_email or None,
         "created_at": now_iso(),
     }
-    orgs.append(rec)
+    orgs.add(rec)
     return rec
 
 
 def upsert_project(
-    projs: List[Dict],
+    projs: ProjectStore | List[Dict],
     *,
     organization_id: int,
     name: str,
@@ -117,25 +461,31 @@ def upsert_project(
     ensure_min_chars: int = 600,
     site_markdown: str | None = None,
 ) -> Dict:
+    if not isinstance(projs, ProjectStore):
+        projs = ProjectStore(projs)  # plain list: index it once for this call
     nm = (name or "").strip()
     src = (source_url or "").strip()
 
-    # Update existing by (org_id + name) OR by source_url
-    for p in projs:
-        if src and (p.get("source_url") or "").strip().lower() == src.lower():
-            if nm:
-                p["name"] = nm
-            if description and (len(description) > len(p.get("description") or "")):
-                p["description"] = description
-            return p
-
-    for p in projs:
-        if p.get("organization_id") == organization_id and (p.get("name") or "").strip().lower() == nm.lower():
-            if description and (len(description) > len(p.get("description") or "")):
-                p["description"] = description
-            if src:
-                p["source_url"] = src
-            return p
+    # Update existing by source_url OR by (org_id + name)
+    p = projs.find(projs.by_source_url, src.lower()) if src else None
+    if p is not None:
+        fields = {}
+        if nm:
+            fields["name"] = nm
+        if description and (len(description) > len(p.get("description") or "")):
+            fields["description"] = description
+        projs.update(p, **fields)
+        return p
+
+    p = projs.find(projs.by_org_name, (organization_id, nm.lower()))
+    if p is not None:
+        fields = {}
+        if description and (len(description) > len(p.get("description") or "")):
+            fields["description"] = description
+        if src:
+            fields["source_url"] = src
+        projs.update(p, **fields)
+        return p
 
     # Expand if too short
     final_desc = (description or "").strip()
@@ -145,14 +495,13 @@ def upsert_project(
         except Exception:
             pass
 
-    new_id = max([p.get("project_id", 0) for p in projs], default=0) + 1
     rec = {
-        "project_id": new_id,
+        "project_id": projs.new_id(),
         "name": nm,
         "description": final_desc,
         "created_at": now_iso(),
         "organization_id": organization_id,
         "source_url": src or None,
     }
-    projs.append(rec)
+    projs.add(rec)
     return rec